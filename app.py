@@ -1,145 +1,381 @@
+import multiprocessing
+import numpy as np
+import os
+from operator import itemgetter
 import pdfplumber
 import re
+import string
+import sys
 
-def extract_pdf_coordinates(pdf_path):
+# Letters checked when deciding whether a cell should be marked
+_LETTERS = frozenset(string.ascii_letters)
+
+# Metadata pattern (e.g., 'key: value')
+_METADATA_RE = re.compile(r':\s*\S')
+
+COLUMN_KEYWORDS = [
+    "item", "description", "product", "name", "particulars",
+    "qty", "quantity", "rate", "price", "amount", "total",
+    "gst", "tax", "hsn", "code", "unit", "net", "discount"
+]
+
+# Single-pass matcher for all column keywords. The lookahead lets matches overlap,
+# so every keyword occurring in a cell is found (no keyword is a prefix of another).
+_KEYWORD_RE = re.compile('(?=(' + '|'.join(map(re.escape, COLUMN_KEYWORDS)) + '))')
+
+def extract_single_page(page, engine="pdfplumber", tables_only=False):
+    """
+    Extracts the table cells (with text) and words of a single page.
+
+    Args:
+        page: The page to extract (a pdfplumber page, or a PyMuPDF page when engine is "pymupdf").
+        engine (str): The library the page comes from, "pdfplumber" or "pymupdf".
+        tables_only (bool): If True, words are not extracted on pages without tables.
+
+    Returns:
+        dict: The page's tables and words, plus the word coordinates as NumPy arrays (see build_word_arrays).
+              Each table is a dict with its 'bbox', its 'cells' (list of rows, each row is a list
+              of (bbox, text)) and the 'text' extracted once from the table (list of rows of strings).
+    """
+    page_data = {"tables": [], "words": []}
+
+    # Extract table cell coordinates and text (PyMuPDF's table API mirrors pdfplumber's)
+    for table in page.find_tables():
+        table_rows_data = []
+        table_text_data = table.extract() # Extracts text as list of lists
+
+        for row_idx, row in enumerate(table.rows):
+            current_row_cells = []
+            for col_idx, cell_bbox in enumerate(row.cells):
+                cell_text = None
+                if table_text_data and row_idx < len(table_text_data) and col_idx < len(table_text_data[row_idx]):
+                    cell_text = table_text_data[row_idx][col_idx]
+                
+                if cell_bbox:
+                    current_row_cells.append((cell_bbox, cell_text if cell_text else ""))
+                else:
+                    current_row_cells.append((None, None))
+            table_rows_data.append(current_row_cells)
+        page_data["tables"].append({"bbox": table.bbox, "cells": table_rows_data, "text": table_text_data})
+
+    # Extract word/phrase coordinates (including text). With tables_only, words are
+    # skipped on pages without tables since they are only used for table structuring.
+    if not tables_only or page_data["tables"]:
+        if engine == "pymupdf":
+            # PyMuPDF words are (x0, y0, x1, y1, text, block_no, line_no, word_no)
+            for word in page.get_text("words"):
+                page_data["words"].append((word[4], word[0], word[1], word[2], word[3]))
+        else:
+            for word in page.extract_words():
+                page_data["words"].append((word['text'], word['x0'], word['top'], word['x1'], word['bottom']))
+
+    # Also keep the word coordinates as column arrays for vectorized filtering
+    page_data.update(build_word_arrays(page_data["words"]))
+
+    return page_data
+
+def _import_pymupdf():
+    """
+    Imports PyMuPDF, which is only needed for engine="pymupdf", on first use.
+    Releases before 1.24.3 only provide the module under its old name, 'fitz'.
+
+    Returns:
+        module: The PyMuPDF module.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            raise ImportError("The 'pymupdf' engine requires PyMuPDF 1.23 or later (pip install pymupdf)") from None
+    return pymupdf
+
+def _extract_pages(pdf_path, page_numbers, engine, tables_only):
+    """
+    Opens the PDF once and extracts the given pages.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        page_numbers (list): 1-based page numbers to extract, or None for all pages.
+                             Page numbers outside the document are ignored.
+        engine (str): "pdfplumber" or "pymupdf".
+        tables_only (bool): See extract_single_page.
+
+    Returns:
+        dict: Page data (see extract_single_page) keyed by page number.
+    """
+    if engine == "pymupdf":
+        with _import_pymupdf().open(pdf_path) as doc:
+            if page_numbers is None:
+                page_numbers = range(1, doc.page_count + 1)
+            return {page_number: extract_single_page(doc[page_number - 1], engine, tables_only)
+                    for page_number in page_numbers if 1 <= page_number <= doc.page_count}
+
+    # laparams is left unset on purpose: passing it turns on pdfminer's layout analysis,
+    # which this extraction does not need and which makes parsing slower.
+    with pdfplumber.open(pdf_path, pages=page_numbers) as pdf:
+        return {page.page_number: extract_single_page(page, engine, tables_only) for page in pdf.pages}
+
+def _process_page(args):
+    """
+    Worker for extract_pdf_coordinates: opens the PDF in the worker process and extracts one page.
+
+    Args:
+        args (tuple): (pdf_path, page_number, engine, tables_only) with a 1-based page number.
+
+    Returns:
+        dict: Page data keyed by page number (empty if the page does not exist)
+    """
+    pdf_path, page_number, engine, tables_only = args
+    return _extract_pages(pdf_path, [page_number], engine, tables_only)
+
+def extract_pdf_coordinates(pdf_path, pages=None, engine="pdfplumber", tables_only=False):
     """
     Extracts coordinates of all table cells (with text) and all words/expressions/phrases
-    from a PDF using pdfplumber.
+    from a PDF. Multi-page PDFs are processed in parallel, one page per worker process.
 
     Args:
         pdf_path (str): The path to the PDF file.
+        pages (list, optional): 1-based page numbers to extract. All pages are extracted if None.
+        engine (str): "pdfplumber" (default) or "pymupdf". PyMuPDF is much faster at parsing,
+                      but its word boxes are taller, which can merge rows close to each other.
+        tables_only (bool): If True, words are only extracted on pages that contain tables.
 
     Returns:
-        dict: A dictionary where keys are page numbers and values contain lists of coordinates
-              for tables (cell-level with text) and words.
+        dict: A dictionary where keys are page numbers (in document order) and values contain
+              the page data returned by extract_single_page.
     """
-    all_coordinates = {}
+    if engine not in ("pdfplumber", "pymupdf"):
+        raise ValueError(f"Unknown engine '{engine}', expected 'pdfplumber' or 'pymupdf'")
+    if engine == "pymupdf":
+        _import_pymupdf() # Fail early if PyMuPDF is not installed
+
+    cpu_count = os.cpu_count() or 1
+    page_numbers = sorted(set(pages)) if pages is not None else None
+    if page_numbers is None and cpu_count > 1:
+        # The page count is only needed to size the worker pool
+        if engine == "pymupdf":
+            with _import_pymupdf().open(pdf_path) as doc:
+                page_numbers = list(range(1, doc.page_count + 1))
+        else:
+            with pdfplumber.open(pdf_path) as pdf:
+                page_numbers = list(range(1, len(pdf.pages) + 1))
+    workers = min(cpu_count, len(page_numbers)) if page_numbers is not None else 1
+
+    if workers <= 1:
+        # Single page or single CPU: not worth the process start-up cost, open the file once
+        extracted_pages = _extract_pages(pdf_path, page_numbers, engine, tables_only)
+    else:
+        # Page objects are not shared across processes, so every worker opens the file itself
+        extracted_pages = {}
+        with multiprocessing.Pool(workers) as pool:
+            for page_result in pool.imap_unordered(_process_page, [(pdf_path, page_number, engine, tables_only) for page_number in page_numbers]):
+                extracted_pages.update(page_result)
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            page_data = {"tables": [], "words": []}
-
-            # Extract table cell coordinates and text
-            for table in page.find_tables():
-                table_rows_data = []
-                table_text_data = table.extract() # Extracts text as list of lists
-
-                for row_idx, row in enumerate(table.rows):
-                    current_row_cells = []
-                    for col_idx, cell_bbox in enumerate(row.cells):
-                        cell_text = None
-                        if table_text_data and row_idx < len(table_text_data) and col_idx < len(table_text_data[row_idx]):
-                            cell_text = table_text_data[row_idx][col_idx]
-                        
-                        if cell_bbox:
-                            current_row_cells.append((cell_bbox, cell_text if cell_text else ""))
-                        else:
-                            current_row_cells.append((None, None))
-                    table_rows_data.append(current_row_cells)
-                page_data["tables"].append(table_rows_data)
-
-            # Extract word/phrase coordinates (including text)
-            for word in page.extract_words():
-                page_data["words"].append((word['text'], word['x0'], word['top'], word['x1'], word['bottom']))
-            
-            all_coordinates[f"page_{page_num + 1}"] = page_data
+    all_coordinates = {}
+    for page_number in sorted(extracted_pages):
+        all_coordinates[f"page_{page_number}"] = extracted_pages[page_number]
     
     return all_coordinates
 
-def find_column_for_word(word_x0, word_x1, column_boundaries):
+def build_word_arrays(page_words):
     """
-    Find which column a word belongs to based on horizontal alignment with defined column boundaries.
+    Convert a list of word tuples into per-coordinate NumPy arrays (structure of arrays),
+    together with an index of the words sorted by their top coordinate (y0).
     Args:
-        word_x0, word_x1: Horizontal coordinates of the word
-        column_boundaries: List of (x0, x1) tuples for each column
+        page_words: List of word data tuples (text, x0, y0, x1, y1)
     Returns:
-        int: Column index if found, -1 if not found. Returns the first column that the word largely overlaps with.
+        dict: 'words_text' (object array), 'words_x0', 'words_y0', 'words_x1', 'words_y1' (float arrays),
+              'words_order' (indices sorting the words by y0) and 'sorted_y0', 'sorted_y1'
     """
-    word_center = (word_x0 + word_x1) / 2
-    
-    for col_idx, (col_x0, col_x1) in enumerate(column_boundaries):
-        # Check if the word's center is within the column, or if it largely overlaps
-        # A more robust overlap check might be needed for complex cases
-        overlap_start = max(word_x0, col_x0)
-        overlap_end = min(word_x1, col_x1)
-        
-        # Calculate overlap percentage. If a word significantly overlaps a column, assign it.
-        # This heuristic can be adjusted.
-        if overlap_end > overlap_start:
-            overlap_width = overlap_end - overlap_start
-            word_width = word_x1 - word_x0
-            col_width = col_x1 - col_x0
-
-            if word_width > 0 and (overlap_width / word_width > 0.5 or overlap_width / col_width > 0.5):
-                return col_idx
-            elif word_x0 >= col_x0 and word_x1 <= col_x1: # Word fully contained
-                return col_idx
-            elif word_center >= col_x0 and word_center <= col_x1: # Word center in column
-                return col_idx
-            
-    return -1
-
-def separate_rows_by_vertical_gap(cell_words):
+    words_y0 = np.array([word[2] for word in page_words], dtype=np.float64)
+    words_y1 = np.array([word[4] for word in page_words], dtype=np.float64)
+    words_order = np.argsort(words_y0, kind='stable')
+    return {
+        "words_text": np.array([word[0] for word in page_words], dtype=object),
+        "words_x0": np.array([word[1] for word in page_words], dtype=np.float64),
+        "words_y0": words_y0,
+        "words_x1": np.array([word[3] for word in page_words], dtype=np.float64),
+        "words_y1": words_y1,
+        "words_order": words_order,
+        "sorted_y0": words_y0[words_order],
+        "sorted_y1": words_y1[words_order],
+    }
+
+def find_words_in_box(page_data, bbox, tolerance=2):
     """
-    Separate words into different rows based on vertical gaps between them.
-    This function is now more general, operating on any list of words.
+    Find the words fully contained in a bounding box, with a small tolerance.
+    Only the words whose y0 falls within the box are looked at, using a binary search
+    on the y0-sorted index.
     Args:
-        cell_words: List of word data tuples (text, x0, y0, x1, y1)
+        page_data: Page dictionary holding the word arrays built by build_word_arrays
+        bbox: (x0, y0, x1, y1) bounding box
+        tolerance: Tolerance added on all sides of the box
     Returns:
-        list: List of row groups, each containing words for that row, sorted horizontally
+        np.ndarray: Indices (in page order) of the matching words in page_data['words']
+    """
+    box_x0, box_y0, box_x1, box_y1 = bbox
+    sorted_y0 = page_data["sorted_y0"]
+    start = np.searchsorted(sorted_y0, box_y0 - tolerance, side='left')
+    end = np.searchsorted(sorted_y0, box_y1 + tolerance, side='right')
+    candidates = page_data["words_order"][start:end]
+    mask = ((page_data["words_x0"][candidates] >= box_x0 - tolerance) &
+            (page_data["words_x1"][candidates] <= box_x1 + tolerance) &
+            (page_data["sorted_y1"][start:end] <= box_y1 + tolerance))
+    return np.sort(candidates[mask])
+
+def find_columns_for_words(words_x0, words_x1, col_bounds):
+    """
+    Find which column each word belongs to based on horizontal alignment with defined column boundaries.
+    All words are tested against all columns at once using NumPy broadcasting.
+    Args:
+        words_x0, words_x1: Arrays of horizontal word coordinates
+        col_bounds: Array of shape (n_cols, 2) holding the (x0, x1) boundaries of each column
+    Returns:
+        np.ndarray: Column index for each word. A word is assigned to the first column it largely
+                    overlaps with, falling back to the column whose center is closest to the word's center.
+    """
+    words_x0 = np.asarray(words_x0, dtype=np.float64)
+    words_x1 = np.asarray(words_x1, dtype=np.float64)
+    if words_x0.size == 0:
+        return np.empty(0, dtype=np.intp)
+
+    col_x0 = col_bounds[:, 0]
+    col_x1 = col_bounds[:, 1]
+    wx0 = words_x0[:, None]
+    wx1 = words_x1[:, None]
+    word_center = (wx0 + wx1) / 2
+    word_width = wx1 - wx0
+    col_width = col_x1 - col_x0
+
+    # Overlap matrix of shape (n_words, n_cols)
+    overlap_width = np.minimum(wx1, col_x1) - np.maximum(wx0, col_x0)
+
+    # Same heuristics as before: large overlap relative to the word or the column,
+    # word fully contained, or word center inside the column.
+    largely_overlaps = ((word_width > 0) & (overlap_width > 0.5 * word_width)) | (overlap_width > 0.5 * col_width)
+    contained = (wx0 >= col_x0) & (wx1 <= col_x1)
+    center_inside = (word_center >= col_x0) & (word_center <= col_x1)
+    matches = (overlap_width > 0) & (largely_overlaps | contained | center_inside)
+
+    col_idx = matches.argmax(axis=1)
+    unmatched = ~matches.any(axis=1)
+    if unmatched.any():
+        # Fallback: closest column by center distance
+        col_center = (col_x0 + col_x1) / 2
+        dist = np.abs(word_center[unmatched] - col_center)
+        col_idx[unmatched] = dist.argmin(axis=1)
+
+    return col_idx
+
+def find_columns_for_cells(cells_x0, cells_x1, col_bounds):
+    """
+    Find which column each table cell belongs to, based on horizontal overlap with the column boundaries.
+    Args:
+        cells_x0, cells_x1: Arrays of horizontal cell coordinates
+        col_bounds: Array of shape (n_cols, 2) holding the (x0, x1) boundaries of each column
+    Returns:
+        np.ndarray: Column index for each cell. A cell is assigned to the column it overlaps the most,
+                    falling back to the column whose center is closest to the cell's center.
+    """
+    cells_x0 = np.asarray(cells_x0, dtype=np.float64)
+    cells_x1 = np.asarray(cells_x1, dtype=np.float64)
+    if cells_x0.size == 0:
+        return np.empty(0, dtype=np.intp)
+
+    col_x0 = col_bounds[:, 0]
+    col_x1 = col_bounds[:, 1]
+    # Overlap matrix of shape (n_cells, n_cols), negative overlaps clamped to 0
+    overlap_width = np.clip(np.minimum(cells_x1[:, None], col_x1) - np.maximum(cells_x0[:, None], col_x0), 0, None)
+
+    col_idx = overlap_width.argmax(axis=1)
+    no_overlap = overlap_width.max(axis=1) == 0
+    if no_overlap.any():
+        # Fallback: closest column by center distance
+        cell_center = (cells_x0[no_overlap] + cells_x1[no_overlap]) / 2
+        col_center = (col_x0 + col_x1) / 2
+        col_idx[no_overlap] = np.abs(cell_center[:, None] - col_center).argmin(axis=1)
+
+    return col_idx
+
+def _split_rows(y0, y1):
+    """
+    Assign a row number to each word, starting a new row at every significant vertical gap.
+    Args:
+        y0, y1: Lists of top and bottom coordinates of the words, sorted by y0 (then x0)
+    Returns:
+        list: Row number of each word, in the same order
     """
-    if not cell_words:
+    if not y0:
         return []
-    
-    # Sort words primarily by vertical position (y0), then by horizontal (x0)
-    sorted_words = sorted(cell_words, key=lambda w: (w[2], w[1]))  # Sort by y0, then x0
-    
-    rows = []
-    current_row = [sorted_words[0]]
-    
+
     # Calculate average word height for gap threshold based on the first few words
     # to avoid skewed averages from very short/tall words.
-    sample_words = sorted_words[:min(len(sorted_words), 10)]
-    word_heights = [word[4] - word[2] for word in sample_words if word[4] - word[2] > 0]
+    word_heights = [bottom - top for top, bottom in zip(y0[:10], y1[:10]) if bottom - top > 0]
     avg_word_height = sum(word_heights) / len(word_heights) if word_heights else 10
-    
+
     # Gap threshold: a gap larger than this suggests a new row
     gap_threshold = avg_word_height * 0.7  # Adjusted heuristic, can be fine-tuned
-    
+
     # Track current row's max bottom (y1) for gap calculation
-    current_row_max_y1 = sorted_words[0][4]
-    
-    for i in range(1, len(sorted_words)):
-        word_text, word_x0, word_y0, word_x1, word_y1 = sorted_words[i]
-        
+    row_ids = [0]
+    current_row = 0
+    current_row_max_y1 = y1[0]
+    for word_y0, word_y1 in zip(y0[1:], y1[1:]):
         # Calculate vertical gap from the bottom of the current row to the top of the next word
-        vertical_gap = word_y0 - current_row_max_y1
-        
-        # If the gap is significant, start a new row
-        if vertical_gap > gap_threshold:
-            # Sort words in the current_row by x0 before appending
-            rows.append(sorted(current_row, key=lambda w: w[1]))
-            current_row = [sorted_words[i]]
+        if word_y0 - current_row_max_y1 > gap_threshold:
+            current_row += 1
             current_row_max_y1 = word_y1 # Reset max y1 for the new row
-        else:
-            # Word belongs to the current row
-            current_row.append(sorted_words[i])
-            current_row_max_y1 = max(current_row_max_y1, word_y1) # Update max y1
-    
-    # Add the last row
-    if current_row:
-        rows.append(sorted(current_row, key=lambda w: w[1])) # Sort last row as well
-    
-    return rows
+        elif word_y1 > current_row_max_y1:
+            current_row_max_y1 = word_y1 # Update max y1
+        row_ids.append(current_row)
+
+    return row_ids
+
+def split_words_by_vertical_gap(words_x0, words_y0, words_y1):
+    """
+    Index-based version of separate_rows_by_vertical_gap, working directly on coordinate arrays.
+    Args:
+        words_x0, words_y0, words_y1: Arrays of word coordinates
+    Returns:
+        list: List of index arrays (into the given coordinate arrays), one per row, each sorted horizontally
+    """
+    if len(words_y0) == 0:
+        return []
+
+    # Sort words primarily by vertical position (y0), then by horizontal (x0)
+    order = np.lexsort((words_x0, words_y0))
+    # The gap walk is sequential and only sees a handful of words, so it runs on plain lists
+    row_ids = np.array(_split_rows(words_y0[order].tolist(), words_y1[order].tolist()))
+
+    # Split the sorted words wherever the row number changes, then sort each row by x0
+    row_starts = np.flatnonzero(np.diff(row_ids)) + 1
+    return [row[np.argsort(words_x0[row], kind='stable')] for row in np.split(order, row_starts)]
+
+def separate_rows_by_vertical_gap(cell_words):
+    """
+    Separate words into different rows based on vertical gaps between them.
+    This function is now more general, operating on any list of words.
+    Args:
+        cell_words: List of word data tuples (text, x0, y0, x1, y1)
+    Returns:
+        list: List of row groups, each containing words for that row, sorted horizontally
+    """
+    rows = split_words_by_vertical_gap(np.array([word[1] for word in cell_words], dtype=np.float64),
+                                       np.array([word[2] for word in cell_words], dtype=np.float64),
+                                       np.array([word[4] for word in cell_words], dtype=np.float64))
+    return [[cell_words[i] for i in row_indices] for row_indices in rows]
 
-def create_structured_table(table_rows, header_row_index, page_words):
+def create_structured_table(table_rows, header_row_index, page_data):
     """
     Create a structured table that combines both re-parsed (for #$ marked cells)
     and directly transferred (for unmarked cells) content, maintaining vertical order.
+    Word-to-row and word-to-column assignments are computed for the whole table at once.
     Args:
         table_rows: Raw table data from PDFPlumber (list of rows, each row is list of (bbox, text))
         header_row_index: Index of the header row
-        page_words: List of all words on the page with coordinates (text, x0, y0, x1, y1)
+        page_data: Page dictionary with all words on the page (text, x0, y0, x1, y1) and their coordinate arrays
     Returns:
         list: Structured table data (list of lists, where inner list is a row of strings)
     """
@@ -149,182 +385,110 @@ def create_structured_table(table_rows, header_row_index, page_words):
     header_cells = table_rows[header_row_index]
 
     # 1. Determine robust column boundaries from header cells
-    column_boundaries = []
-    for cell_bbox, cell_text in header_cells:
-        if cell_bbox:
-            column_boundaries.append((cell_bbox[0], cell_bbox[2])) # (x0, x1)
+    col_bounds = np.array([(cell_bbox[0], cell_bbox[2]) for cell_bbox, _ in header_cells if cell_bbox], dtype=np.float64) # (x0, x1)
 
-    if not column_boundaries:
+    if len(col_bounds) == 0:
         return []
 
-    # List to store (vertical_position, structured_row_data) tuples for sorting
-    rows_with_positions = []
-
-    # Iterate through all original pdfplumber rows
+    # 2. Single pass over the original rows: look for #$ marks and compute each row's vertical range
+    rows_marked = []
+    row_y = np.empty((len(table_rows), 2)) # (min_y, max_y), (inf, -inf) if the row has no valid bbox
     for original_row_idx, original_row_cells in enumerate(table_rows):
         current_row_has_marked_cells = False
+        row_min_y = float('inf')
+        row_max_y = float('-inf')
         for cell_bbox, cell_text in original_row_cells:
             if cell_text and cell_text.startswith("#$"):
                 current_row_has_marked_cells = True
-                break
+            if cell_bbox:
+                if cell_bbox[1] < row_min_y:
+                    row_min_y = cell_bbox[1]
+                if cell_bbox[3] > row_max_y:
+                    row_max_y = cell_bbox[3]
+        rows_marked.append(current_row_has_marked_cells)
+        row_y[original_row_idx] = (row_min_y, row_max_y)
+
+    # 3. Words that vertically overlap each original row's range: (n_words, n_rows) matrix
+    words_text = page_data['words_text']
+    words_x0 = page_data['words_x0']
+    words_y0 = page_data['words_y0']
+    words_y1 = page_data['words_y1']
+    tolerance_y = 2 # Small vertical tolerance for word inclusion
+    in_row = (words_y1[:, None] >= row_y[:, 0] - tolerance_y) & (words_y0[:, None] <= row_y[:, 1] + tolerance_y)
+
+    # Minimum y0 of the words in each row, used to sort unmarked rows
+    row_words_min_y0 = np.where(in_row, words_y0[:, None], np.inf).min(axis=0, initial=np.inf)
+
+    # Column of every word on the page (a word's column does not depend on its row)
+    word_cols = find_columns_for_words(words_x0, page_data['words_x1'], col_bounds)
+
+    # List to store (vertical_position, structured_row_data) tuples for sorting
+    rows_with_positions = []
+
+    for original_row_idx, original_row_cells in enumerate(table_rows):
+        row_min_y = row_y[original_row_idx, 0]
 
-        if current_row_has_marked_cells:
+        if rows_marked[original_row_idx]:
             # This row (or set of original pdfplumber cells) contains #$ marked content.
             # We need to extract words that belong to this original row's vertical span
             # and then re-structure them.
 
-            row_min_y = float('inf')
-            row_max_y = float('-inf')
-            for cell_bbox, _ in original_row_cells:
-                if cell_bbox:
-                    row_min_y = min(row_min_y, cell_bbox[1])
-                    row_max_y = max(row_max_y, cell_bbox[3])
-
-            if row_min_y == float('inf'): # No valid bbox for this original row
+            if row_min_y == np.inf: # No valid bbox for this original row
                 continue # Skip this row (or handle as empty/error)
 
-            words_in_this_original_row = []
-            tolerance_y = 2 # Small vertical tolerance for word inclusion
-            for word_data in page_words:
-                word_text, word_x0, word_y0, word_x1, word_y1 = word_data
-                # Check if word vertically overlaps with the original row's vertical range
-                if (word_y0 >= row_min_y - tolerance_y and word_y0 <= row_max_y + tolerance_y) or \
-                   (word_y1 >= row_min_y - tolerance_y and word_y1 <= row_max_y + tolerance_y) or \
-                   (word_y0 <= row_min_y - tolerance_y and word_y1 >= row_max_y + tolerance_y):
-                    words_in_this_original_row.append(word_data)
+            row_word_indices = np.flatnonzero(in_row[:, original_row_idx])
 
             # Separate words into logical sub-rows based on vertical gaps
-            logical_sub_rows = separate_rows_by_vertical_gap(words_in_this_original_row)
-
-            # Map words in each logical sub-row to columns and add to final list
-            for sub_row_words in logical_sub_rows:
-                structured_sub_row = [""] * len(column_boundaries)
-                words_in_cols = {i: [] for i in range(len(column_boundaries))}
-                
-                # Get y_position for this sub_row (using the y0 of the first word)
-                # Use the y0 of the first word in the already vertically sorted sub_row_words
-                sub_row_y_pos = sub_row_words[0][2] if sub_row_words else row_min_y # Fallback if no words
-
-                for word_text, word_x0, word_y0, word_x1, word_y1 in sub_row_words:
-                    col_idx = find_column_for_word(word_x0, word_x1, column_boundaries)
-                    if col_idx != -1:
-                        words_in_cols[col_idx].append(word_text)
-                    else:
-                        # Fallback: find closest column if not directly within one
-                        min_dist = float('inf')
-                        closest_col_idx = -1
-                        word_center = (word_x0 + word_x1) / 2
-                        for i, (col_x0, col_x1) in enumerate(column_boundaries):
-                            col_center = (col_x0 + col_x1) / 2
-                            dist = abs(word_center - col_center)
-                            if dist < min_dist:
-                                min_dist = dist
-                                closest_col_idx = i
-                        if closest_col_idx != -1:
-                            words_in_cols[closest_col_idx].append(word_text)
-
-                for col_idx, words in words_in_cols.items():
-                    if words:
-                        structured_sub_row[col_idx] = " ".join(words)
+            logical_sub_rows = split_words_by_vertical_gap(words_x0[row_word_indices],
+                                                           words_y0[row_word_indices],
+                                                           words_y1[row_word_indices])
+
+            # Group the words of each logical sub-row by column, keeping their horizontal order
+            for sub_row in logical_sub_rows:
+                sub_row_word_indices = row_word_indices[sub_row]
+                by_col = np.argsort(word_cols[sub_row_word_indices], kind='stable')
+                sub_row_word_indices = sub_row_word_indices[by_col]
+                sub_row_cols = word_cols[sub_row_word_indices]
+                col_starts = np.flatnonzero(np.diff(sub_row_cols)) + 1
+
+                structured_sub_row = [""] * len(col_bounds)
+                for col_word_indices in np.split(sub_row_word_indices, col_starts):
+                    structured_sub_row[word_cols[col_word_indices[0]]] = " ".join(words_text[col_word_indices])
 
                 if any(cell.strip() for cell in structured_sub_row):
-                    # Collect all words that contributed to this structured_sub_row
-                    # to get an accurate y_pos for sorting
-                    words_for_sub_row_y_pos = []
-                    for word_data in sub_row_words:
-                        if word_data[0] in " ".join(structured_sub_row): # Simple check if word text is in the final cell string
-                            words_for_sub_row_y_pos.append(word_data)
-
-                    # Use the minimum y0 of all words in this sub_row as its vertical position
-                    sub_row_y_pos = min(word[2] for word in words_for_sub_row_y_pos) if words_for_sub_row_y_pos else row_min_y
-
-                    rows_with_positions.append((sub_row_y_pos, structured_sub_row))
+                    # Use the minimum y0 of the words in this sub_row as its vertical position
+                    rows_with_positions.append((words_y0[sub_row_word_indices].min(), structured_sub_row))
 
         else:
             # This row does NOT contain #$ marks, so just transfer its content and align to columns.
+
+            # Vertical position based on the words in the row, for consistent sorting
+            raw_row_y_pos = row_words_min_y0[original_row_idx]
+            if raw_row_y_pos == np.inf:
+                raw_row_y_pos = original_row_idx * 100 # Fallback
             
-            # First, find all page words that fall within this original row's vertical range
-            raw_row_min_y = float('inf')
-            raw_row_max_y = float('-inf')
-            for cell_bbox, _ in original_row_cells:
-                if cell_bbox:
-                    raw_row_min_y = min(raw_row_min_y, cell_bbox[1])
-                    raw_row_max_y = max(raw_row_max_y, cell_bbox[3])
-
-            words_in_raw_row = []
-            if raw_row_min_y != float('inf'): # Only collect words if row has valid bbox
-                tolerance_y = 2
-                for word_data in page_words:
-                    word_text, word_x0, word_y0, word_x1, word_y1 = word_data
-                    if (word_y0 >= raw_row_min_y - tolerance_y and word_y0 <= raw_row_max_y + tolerance_y) or \
-                       (word_y1 >= raw_row_min_y - tolerance_y and word_y1 <= raw_row_max_y + tolerance_y) or \
-                       (word_y0 <= raw_row_min_y - tolerance_y and word_y1 >= raw_row_max_y + tolerance_y):
-                        words_in_raw_row.append(word_data)
-            
-            # Calculate raw_row_y_pos based on words, for consistent sorting
-            raw_row_y_pos = min(word[2] for word in words_in_raw_row) if words_in_raw_row else original_row_idx * 100 # Fallback
-            
-            mapped_raw_row = [""] * len(column_boundaries)
-            for cell_idx, (cell_bbox, cell_text) in enumerate(original_row_cells):
-                if cell_text is not None: # Only process if there's text (even if empty string)
-                    if cell_bbox:
-                        assigned_col = -1 
-                        
-                        # 1. Try to assign based on best horizontal overlap
-                        best_col_idx = -1
-                        max_overlap_width = 0
-                        cell_x0, cell_y0, cell_x1, cell_y1 = cell_bbox
-
-                        for col_b_idx, (col_x0, col_x1) in enumerate(column_boundaries):
-                            # Calculate horizontal overlap
-                            overlap_x_start = max(cell_x0, col_x0)
-                            overlap_x_end = min(cell_x1, col_x1)
-                            
-                            if overlap_x_end > overlap_x_start:
-                                overlap_width = overlap_x_end - overlap_x_start
-                                if overlap_width > max_overlap_width:
-                                    max_overlap_width = overlap_width
-                                    best_col_idx = col_b_idx
-                        
-                        if best_col_idx != -1:
-                            assigned_col = best_col_idx
-                        else:
-                            # 2. Fallback: if no clear overlap, try closest column by center
-                            min_dist_to_col_center = float('inf')
-                            closest_col_idx = -1
-                            cell_center_x = (cell_x0 + cell_x1) / 2
-                            for col_b_idx, (col_x0, col_x1) in enumerate(column_boundaries):
-                                col_center_x = (col_x0 + col_x1) / 2
-                                dist = abs(cell_center_x - col_center_x)
-                                if dist < min_dist_to_col_center:
-                                    min_dist_to_col_center = dist
-                                    closest_col_idx = col_b_idx
-                            if closest_col_idx != -1:
-                                assigned_col = closest_col_idx
-                        
-                        if assigned_col != -1:
-                            if mapped_raw_row[assigned_col]:
-                                mapped_raw_row[assigned_col] += " " + cell_text
-                            else:
-                                mapped_raw_row[assigned_col] = cell_text
-                        elif len(column_boundaries) > 0: # Final fallback if nothing else works, put in first column
-                            if mapped_raw_row[0]:
-                                mapped_raw_row[0] += " " + cell_text
-                            else:
-                                mapped_raw_row[0] = cell_text
-                    else:
-                        # If no bbox, but text exists, append to first column as a fallback.
-                        if len(column_boundaries) > 0:
-                            if mapped_raw_row[0]:
-                                mapped_raw_row[0] += " " + cell_text
-                            else:
-                                mapped_raw_row[0] = cell_text
+            # Only process cells with text (even if empty string)
+            text_cells = [(cell_bbox, cell_text) for cell_bbox, cell_text in original_row_cells if cell_text is not None]
+            # Cells with a bbox are assigned to their best-overlapping column,
+            # cells without a bbox go to the first column as a fallback.
+            bbox_cells = [cell_bbox for cell_bbox, _ in text_cells if cell_bbox]
+            bbox_cell_cols = iter(find_columns_for_cells(np.array([bbox[0] for bbox in bbox_cells]),
+                                                         np.array([bbox[2] for bbox in bbox_cells]),
+                                                         col_bounds))
+
+            mapped_raw_row = [""] * len(col_bounds)
+            for cell_bbox, cell_text in text_cells:
+                assigned_col = next(bbox_cell_cols) if cell_bbox else 0
+                if mapped_raw_row[assigned_col]:
+                    mapped_raw_row[assigned_col] += " " + cell_text
+                else:
+                    mapped_raw_row[assigned_col] = cell_text
             
             if any(cell.strip() for cell in mapped_raw_row):
                 rows_with_positions.append((raw_row_y_pos, mapped_raw_row))
     
     # Sort all rows (both restructured and raw) by their vertical position to ensure correct sequence
-    rows_with_positions.sort(key=lambda x: x[0])
+    rows_with_positions.sort(key=itemgetter(0))
 
     final_structured_table = []
     for y_pos, row_data in rows_with_positions:
@@ -333,45 +497,40 @@ def create_structured_table(table_rows, header_row_index, page_words):
     return final_structured_table
 
 def print_formatted_output(coordinates_data, pdf_filename):
-    COLUMN_KEYWORDS = [
-        "item", "description", "product", "name", "particulars",
-        "qty", "quantity", "rate", "price", "amount", "total",
-        "gst", "tax", "hsn", "code", "unit", "net", "discount"
-    ]
-
     all_structured_tables = []
+    out = [] # Output lines, written to stdout in one go at the end
 
-    print(f"--- PDFPlumber Table & Word Extraction for '{pdf_filename}' ---")
+    out.append(f"--- PDFPlumber Table & Word Extraction for '{pdf_filename}' ---")
 
     for page_name, page_data in coordinates_data.items():
-        print(f"\n--- {page_name.replace('_', ' ').capitalize()} ---")
+        out.append(f"\n--- {page_name.replace('_', ' ').capitalize()} ---")
 
         # Print Table Data
-        print(f"Number of tables found: {len(page_data['tables'])}")
-        for table_idx, table_rows in enumerate(page_data['tables']):
-            print(f"Table {table_idx + 1}:")
+        out.append(f"Number of tables found: {len(page_data['tables'])}")
+        for table_idx, table in enumerate(page_data['tables']):
+            out.append(f"Table {table_idx + 1}:")
+            table_rows = table['cells']
             header_found_in_table = False
             header_row_index = -1 # Store the index of the header row
 
             for row_idx, row_cells in enumerate(table_rows):
                 formatted_cells_display = [] # For printing original cells
-                row_text_content = []
+                # Text content of the row, as extracted by pdfplumber (before any marking).
+                # The extracted text may have fewer rows than the table; missing rows count as empty.
+                row_text = table['text'][row_idx] if table['text'] and row_idx < len(table['text']) else []
+                row_text_content = [text.lower() for text in row_text if text]
                 none_count_in_row = 0 # Count None cells in the current row
 
                 for cell_data in row_cells:
                     cell_bbox = cell_data[0]
-                    cell_text = cell_data[1]
                     if cell_bbox:
                         formatted_cells_display.append(f"('{cell_bbox[0]:.2f}, {cell_bbox[1]:.2f}'), ('{cell_bbox[2]:.2f}, {cell_bbox[3]:.2f}')")
                     else:
                         formatted_cells_display.append(str(None))
                         none_count_in_row += 1
-
-                    if cell_text:
-                        row_text_content.append(cell_text.lower())
                 
                 # Print the original row content
-                print(f"    Row {row_idx} (Original): {formatted_cells_display}")
+                out.append(f"    Row {row_idx} (Original): {formatted_cells_display}")
 
                 # Check for header keywords in the row and word count
                 row_is_header = False
@@ -381,17 +540,16 @@ def print_formatted_output(coordinates_data, pdf_filename):
                 for cell_text_in_row_content in row_text_content:
                     if cell_text_in_row_content and cell_text_in_row_content.strip() != '':
                         # Check for metadata pattern (e.g., 'key: value')
-                        if re.search(r':\s*\S', cell_text_in_row_content):
+                        if _METADATA_RE.search(cell_text_in_row_content):
                             row_contains_metadata_pattern = True
                             # If a metadata pattern is found, no need to check other cells for metadata in this row
                             # and this row should not be a header, so we can stop further checks for header keywords.
                             # However, for debugging, let's allow keyword count to complete, just mark the flag.
 
-                        for keyword in COLUMN_KEYWORDS:
-                            if keyword in cell_text_in_row_content:
-                                matched_keyword_count += 1
+                        # Each distinct keyword found in the cell counts once
+                        matched_keyword_count += len(set(_KEYWORD_RE.findall(cell_text_in_row_content)))
                 
-                print(f"    Debug: Row {row_idx}, Text Content: {row_text_content}, Matched Keywords: {matched_keyword_count}, Contains Metadata: {row_contains_metadata_pattern}")
+                out.append(f"    Debug: Row {row_idx}, Text Content: {row_text_content}, Matched Keywords: {matched_keyword_count}, Contains Metadata: {row_contains_metadata_pattern}")
 
                 if matched_keyword_count >= 3 and not row_contains_metadata_pattern: # Modified condition
                     row_is_header = True
@@ -399,7 +557,7 @@ def print_formatted_output(coordinates_data, pdf_filename):
                     header_row_index = row_idx
                 
                 if row_is_header:
-                    print(f"    --> Possible header row detected at Row {row_idx}")
+                    out.append(f"    --> Possible header row detected at Row {row_idx}")
 
                 # New logic to mark cells
                 if header_found_in_table and row_idx > header_row_index and none_count_in_row > 1:
@@ -410,50 +568,36 @@ def print_formatted_output(coordinates_data, pdf_filename):
                         # Existing logic for marking cells based on content and newlines
                         should_mark_based_on_content_and_newlines = False
                         if cell_text and cell_text.count('\n') > 3:
-                            contains_digit = bool(re.search(r'\d', cell_text))
-                            contains_letter = bool(re.search(r'[a-zA-Z]', cell_text))
-                            contains_symbol = bool(re.search(r'[^\w\s]', cell_text))
+                            contains_digit = any(c.isdecimal() for c in cell_text) # Same as \d: any Unicode decimal digit
+                            contains_letter = not _LETTERS.isdisjoint(cell_text)
+                            contains_symbol = any(not (c.isalnum() or c == '_' or c.isspace()) for c in cell_text)
                             contains_multiple_phrases = len(cell_text.split()) > 1
 
                             if contains_digit and contains_letter and contains_symbol and contains_multiple_phrases:
                                 should_mark_based_on_content_and_newlines = True
 
-                        # New logic to mark cells based on significant horizontal gaps between words
+                        # New logic to mark cells based on significant horizontal gaps between words,
+                        # or on the sum of all gaps being greater than the average word width
                         should_mark_based_on_horizontal_gap = False
+                        should_mark_based_on_sum_of_gaps = False
                         if cell_text and cell_bbox: # Only proceed if there's text and a bounding box
-                            current_cell_words = []
-                            # Find words that fall within this cell's bounding box
-                            cell_x0, cell_y0, cell_x1, cell_y1 = cell_bbox
-                            for word_data in page_data['words']:
-                                word_text, word_x0, word_y0, word_x1, word_y1 = word_data
-                                # Check if word is within the current cell's bounding box (with a bit of tolerance)
-                                if (word_x0 >= cell_x0 - 2 and word_x1 <= cell_x1 + 2 and
-                                    word_y0 >= cell_y0 - 2 and word_y1 <= cell_y1 + 2):
-                                    current_cell_words.append((word_text, word_x0, word_y0, word_x1, word_y1))
-
-                            if len(current_cell_words) > 1:
-                                current_cell_words.sort(key=lambda w: w[1]) # Sort by x0 for horizontal gap analysis
-                                # Calculate average word width for this cell to determine relative gap
-                                word_widths = [w[3] - w[1] for w in current_cell_words] # x1 - x0
-                                avg_word_width = sum(word_widths) / len(word_widths) if word_widths else 10 # Fallback
+                            # Find words that fall within this cell's bounding box (with a bit of tolerance)
+                            cell_word_indices = find_words_in_box(page_data, cell_bbox)
+
+                            if len(cell_word_indices) > 1:
+                                cell_words_x0 = page_data['words_x0'][cell_word_indices]
+                                cell_words_x1 = page_data['words_x1'][cell_word_indices]
+                                # Sort by x0 for horizontal gap analysis
+                                x_order = np.argsort(cell_words_x0, kind='stable')
+                                sorted_x0 = cell_words_x0[x_order]
+                                sorted_x1 = cell_words_x1[x_order]
+                                # Average word width for this cell determines the relative gap
+                                avg_word_width = (sorted_x1 - sorted_x0).mean()
                                 horizontal_gap_threshold = avg_word_width * 1.5 # Heuristic: 150% of average word width
 
-                                # Check for significant gaps between consecutive words
-                                for k in range(len(current_cell_words) - 1):
-                                    gap = current_cell_words[k+1][1] - current_cell_words[k][3] # x0 of next word - x1 of current word
-                                    if gap > horizontal_gap_threshold:
-                                        should_mark_based_on_horizontal_gap = True
-                                        break
-
-                        # New logic: Check if the sum of all gaps is greater than the average word width
-                        should_mark_based_on_sum_of_gaps = False
-                        if len(current_cell_words) > 1:
-                            total_gap_in_cell = 0
-                            for k in range(len(current_cell_words) - 1):
-                                gap = current_cell_words[k+1][1] - current_cell_words[k][3]
-                                total_gap_in_cell += gap
-                            if total_gap_in_cell > avg_word_width:
-                                should_mark_based_on_sum_of_gaps = True
+                                gaps = sorted_x0[1:] - sorted_x1[:-1] # x0 of next word - x1 of current word
+                                should_mark_based_on_horizontal_gap = bool(gaps.max() > horizontal_gap_threshold)
+                                should_mark_based_on_sum_of_gaps = bool(gaps.sum() > avg_word_width)
 
                         # Apply marking if any of the conditions are met
                         if (should_mark_based_on_content_and_newlines or should_mark_based_on_horizontal_gap or should_mark_based_on_sum_of_gaps) and cell_text and cell_text.strip() != '':
@@ -469,47 +613,49 @@ def print_formatted_output(coordinates_data, pdf_filename):
                         formatted_cells_after_marking.append(f"('{cell_bbox[0]:.2f}, {cell_bbox[1]:.2f}'), ('{cell_bbox[2]:.2f}, {cell_bbox[3]:.2f}'), '{cell_text}'")
                     else:
                         formatted_cells_after_marking.append(f"{str(None)}, '{cell_text}'" if cell_text else str(None))
-                print(f"    Row {row_idx} (After Marking): {formatted_cells_after_marking}")
+                out.append(f"    Row {row_idx} (After Marking): {formatted_cells_after_marking}")
 
             # Create structured table with column mapping
             if header_found_in_table:
-                structured_table = create_structured_table(table_rows, header_row_index, page_data['words'])
+                structured_table = create_structured_table(table_rows, header_row_index, page_data)
                 if structured_table:
                     all_structured_tables.append(structured_table)
-                    # print(f"\n    --> Structured Table {table_idx + 1} (Column-Mapped):")
+                    # out.append(f"\n    --> Structured Table {table_idx + 1} (Column-Mapped):")
                     # for struct_row_idx, struct_row in enumerate(structured_table):
-                    #     print(f"        Row {struct_row_idx}: {struct_row}")
+                    #     out.append(f"        Row {struct_row_idx}: {struct_row}")
 
         # Print Word Data (formatted as pdf plumber example)
-        print("\n==================================================")
-        print("Starting pdf plumber Text and Coordinate Extraction...")
-        print("==================================================")
-        print(f"\n--- pdf plumber Text and Coordinate Extraction for '{pdf_filename}' ---")
-        for word_data in page_data['words']:
-            word_text, x0, y0, x1, y1 = word_data
-            print(f"Page {page_name.split('_')[1]}, Line: ('{word_text}', x0={{:.2f}}, y0={{:.2f}}, x1={{:.2f}}, y1={{:.2f}})".format(x0, y0, x1, y1))
+        out.append("\n==================================================")
+        out.append("Starting pdf plumber Text and Coordinate Extraction...")
+        out.append("==================================================")
+        out.append(f"\n--- pdf plumber Text and Coordinate Extraction for '{pdf_filename}' ---")
+        page_num_str = page_name.split('_')[1]
+        for word_text, x0, y0, x1, y1 in page_data['words']:
+            out.append(f"Page {page_num_str}, Line: ('{word_text}', x0={x0:.2f}, y0={y0:.2f}, x1={x1:.2f}, y1={y1:.2f})")
         
-        print("\n==================================================")
-        print("PDFPlumber Extraction Complete.")
-        print("==================================================")
+        out.append("\n==================================================")
+        out.append("PDFPlumber Extraction Complete.")
+        out.append("==================================================")
 
         # Moved block: Print final marked table for verification at the end of page processing
         if page_data['tables']:
-            print(f"\n--- {page_name.replace('_', ' ').capitalize()} Tables (Final Marked Cells) ---")
-            for table_idx, table_rows in enumerate(page_data['tables']):
-                print(f"    Table {table_idx + 1}:")
-                for final_row_idx, final_row_cells in enumerate(table_rows):
+            out.append(f"\n--- {page_name.replace('_', ' ').capitalize()} Tables (Final Marked Cells) ---")
+            for table_idx, table in enumerate(page_data['tables']):
+                out.append(f"    Table {table_idx + 1}:")
+                for final_row_idx, final_row_cells in enumerate(table['cells']):
                     # Filter out None values
                     final_row_display = [cell_data[1] for cell_data in final_row_cells if cell_data[1] is not None]
-                    print(f"{final_row_display}")
+                    out.append(f"{final_row_display}")
 
     # Print all structured tables collected
     if all_structured_tables:
-        print(f"\n--- All Structured Tables (Resolved #$ cells) ---")
+        out.append(f"\n--- All Structured Tables (Resolved #$ cells) ---")
         for struct_table_idx, structured_output in enumerate(all_structured_tables):
-            print(f"\nTable {struct_table_idx + 1}:")
+            out.append(f"\nTable {struct_table_idx + 1}:")
             for row in structured_output:
-                print(row)
+                out.append(str(row))
+
+    sys.stdout.write("\n".join(out) + "\n")
 
 if __name__ == "__main__":
     pdf_file_2 = "invoice.pdf"